@@ -1,34 +1,42 @@
 from __future__ import annotations
 
 import collections
+import csv
 import datetime
 import functools
+import hashlib
+import itertools
 import logging
 import os
 import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from typing import (
     Any,
     Callable,
     Dict,
     Iterable,
+    Iterator,
     List,
     Mapping,
     Optional,
+    Tuple,
     TypeVar,
     Union,
     overload,
 )
 
 import click
-import matplotlib.pyplot as plt
 import pandas as pd
 import pydantic
 import tomli
 
 import opentoolflux
-from opentoolflux.fluxes import estimate_vol_flux
-from opentoolflux.plot import plot_measurement, plot_time_series
+from opentoolflux.fluxes import (
+    VolFluxEstimate,
+    estimate_vol_fluxes,
+    estimate_vol_fluxes_from_arrays,
+)
 
 from . import database, logging_config, measurements
 
@@ -38,7 +46,10 @@ _DEFAULT_CONFIG_PATH = Path("opentoolflux.toml")
 _DEFAULT_OUTDIR = Path("opentoolflux")
 _DB_FILENAME = "database.feather"
 _PLOTS_SUBDIR = "plots"
+_SRC_CACHE_SUBDIR = ".src-cache"
 _FLUXES_FILENAME = "fluxes.csv"
+# Number of import configurations whose parsed source files are kept in the cache.
+_SRC_CACHE_MAX_DIRS = 4
 
 
 def nicely_repackage_config_problems(func):
@@ -51,6 +62,13 @@ def nicely_repackage_config_problems(func):
     return wrapper
 
 
+singlecore_option = click.option(
+    "--singlecore",
+    is_flag=True,
+    help="Run in a single process instead of using all CPU cores.",
+)
+
+
 def require_database_file(func):
     @functools.wraps(func)
     def wrapper(ctx, *args, **kwargs):
@@ -89,7 +107,13 @@ def main(ctx: click.Context, config_path: Path):
 
 @main.command(name="import")
 @click.pass_context
-def import_(ctx: click.Context):
+@singlecore_option
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Parse all source files, without using or updating the cache of parsed files.",
+)
+def import_(ctx: click.Context, singlecore: bool, no_cache: bool):
     """
     Import data, creating or updating a database file.
 
@@ -97,6 +121,13 @@ def import_(ctx: click.Context):
     `timestamp_col` in the configuration file is used as key. Import data with
     timestamps a already existing in the database file are left unchanged, while
     new data are added to the database.
+
+    The source files are read in parallel using all CPU cores. Use `--singlecore`
+    to read them one at a time, e.g., to make error messages easier to read.
+
+    The parsed source files are cached in the output directory, so that files which
+    have not changed since the last import need not be parsed again. Use
+    `--no-cache` to parse all files anyway.
     """
     conf: Config = ctx.obj["config"]
     if conf.import_ is None:
@@ -115,6 +146,10 @@ def import_(ctx: click.Context):
         conf.import_.columns,
         conf.import_.timestamp_col,
         conf.import_.sep,
+        cache_dir=None
+        if no_cache
+        else _get_src_cache_dir(conf.general.outdir, conf.import_),
+        singlecore=singlecore,
     )
 
     summary_rows = {
@@ -130,19 +165,82 @@ def import_(ctx: click.Context):
     database.save_db(db, db_path)
 
 
+def _get_src_cache_dir(outdir: Path, import_: Import) -> Path:
+    # Each import configuration gets its own cache directory. The cache is pruned
+    # after each import, and this way several configs sharing an output directory
+    # do not remove each other's cached files.
+    key = (
+        tuple(import_.src),
+        tuple(import_.columns.items()),
+        import_.timestamp_col,
+        import_.sep,
+    )
+    digest = hashlib.blake2s(repr(key).encode(), digest_size=8).hexdigest()
+    return outdir / _SRC_CACHE_SUBDIR / digest
+
+
+def _prune_src_cache_dirs(cache_dir: Path):
+    """
+    Remove the least recently used cache directories next to `cache_dir`, keeping
+    `cache_dir` and at most `_SRC_CACHE_MAX_DIRS` directories in total.
+
+    Changing the `[import]` section of the config, e.g., `src` or `columns`, gives a
+    new cache directory. This way the cached data of old configurations are removed
+    eventually, while a few configurations can share an output directory.
+    """
+    os.utime(cache_dir)  # Mark as recently used
+    cache_dirs = sorted(
+        (path for path in cache_dir.parent.iterdir() if path.is_dir()),
+        key=lambda path: (path == cache_dir, path.stat().st_mtime_ns),
+        reverse=True,
+    )
+    for path in cache_dirs[_SRC_CACHE_MAX_DIRS:]:
+        logger.debug(f"Removing unused source file cache '{path}'.")
+        shutil.rmtree(path, ignore_errors=True)
+
+
 def _read_src_files(
     glob_patterns: List[str],
     dtypes: database.DTypes,
     timestamp_col: database.Colname,
     sep: str,
+    cache_dir: Optional[Path] = None,
+    singlecore: bool = False,
 ) -> pd.DataFrame:
     paths = database.find_files(glob_patterns)
-    with click.progressbar(paths, label="Reading source files", show_pos=True) as paths:
-        datasets = [
-            database.read_src_file(path, dtypes, timestamp_col, sep) for path in paths
-        ]
-    result = database.update(database.create_empty_db(dtypes, timestamp_col), *datasets)
-    return result
+    if cache_dir is None:
+        read_src_file = functools.partial(
+            database.read_src_file, dtypes=dtypes, timestamp_col=timestamp_col, sep=sep
+        )
+    else:
+        read_src_file = functools.partial(
+            database.read_src_file_cached,
+            dtypes=dtypes,
+            timestamp_col=timestamp_col,
+            sep=sep,
+            cache_dir=cache_dir,
+        )
+    datasets = list(
+        _map_with_progressbar(
+            read_src_file,
+            paths,
+            length=len(paths),
+            label="Reading source files",
+            singlecore=singlecore,
+            chunksize=1,
+            # The parsing runs in pyarrow or the pandas C parser, which release
+            # the GIL, and threads need not pickle the (large) results.
+            threads=True,
+        )
+    )
+    if cache_dir is not None and cache_dir.exists():
+        database.prune_src_file_cache(cache_dir, paths, dtypes, timestamp_col, sep)
+        _prune_src_cache_dirs(cache_dir)
+    if not datasets:
+        return database.create_empty_db(dtypes, timestamp_col)
+    # All the files were read with the same dtypes, so the datasets can be combined
+    # in one go without validating them against each other.
+    return database.combine(datasets)
 
 
 def _build_db_summary_row(db: pd.DataFrame):
@@ -161,9 +259,9 @@ def info(ctx: click.Context):
     """
     conf: Config = ctx.obj["config"]
     n_measurements = collections.defaultdict(int)
-    for m in _iter_measurements(conf):
+    for m in _iter_measurements(_get_filtered_db(ctx), conf):
         assert conf.measurements
-        (chamber_value,) = m[conf.measurements.chamber_col].unique()
+        chamber_value = m[conf.measurements.chamber_col].iat[0]
         chamber_label = _get_chamber_label(chamber_value, conf.chamber_labels)
         n_measurements[chamber_label] += 1
 
@@ -178,20 +276,35 @@ def info(ctx: click.Context):
 
 @main.command()
 @click.pass_context
+@singlecore_option
 @require_database_file
-def fluxes(ctx: click.Context):
+def fluxes(ctx: click.Context, singlecore: bool):
     """
     Estimate fluxes and save to a csv file in the output directory.
 
+    The measurements are analyzed in parallel using all CPU cores. Use `--singlecore`
+    to run in a single process, e.g., to make error messages easier to read.
+
     This command overwrites previous flux estimates.
     """
     conf: Config = ctx.obj["config"]
-    result = _estimate_fluxes_result_table(_iter_measurements(conf), conf)
     fluxes_path = conf.general.outdir / _FLUXES_FILENAME
-    result.to_csv(
-        fluxes_path,
-        index=False,
-    )
+    # The rows are written as they are estimated, to avoid holding all the results
+    # (and then a CSV rendering of them) in memory at once. They go to a temporary
+    # file first, so that the previous estimates are kept if anything goes wrong.
+    tmp_path = fluxes_path.with_suffix(".tmp")
+    try:
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=_FLUXES_COLUMNS_ORDER)
+            writer.writeheader()
+            for row in _iter_flux_rows(
+                _get_filtered_db(ctx), conf, singlecore=singlecore
+            ):
+                writer.writerow(_format_flux_row(row))
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    tmp_path.replace(fluxes_path)
     logger.info(f"Saved fluxes to '{fluxes_path}'.")
 
 
@@ -206,27 +319,88 @@ def plot(ctx: click.Context):
 
 @plot.command()
 @click.pass_context
+@singlecore_option
 @require_database_file
-def flux_fits(ctx: click.Context):
+def flux_fits(ctx: click.Context, singlecore: bool):
     """
     Estimate fluxes and create figures showing time series and curve fits.
 
     These figures are useful to identify potential problems in the data, and to
     ensure that `t0_delay` and `t0_margin` parameters are set correctly.
 
+    The figures are created in parallel using all CPU cores. Use `--singlecore`
+    to plot in a single process, e.g., to make error messages easier to read.
+
     Pre-existing flux-fits figures are automatically removed by this command.
     """
     conf: Config = ctx.obj["config"]
-    measurements = list(_iter_measurements(conf))
+    db = _get_filtered_db(ctx)
     plot_dir = conf.general.outdir / _PLOTS_SUBDIR / "flux-fits"
     if plot_dir.exists():
         shutil.rmtree(plot_dir)
     plot_dir.mkdir(parents=True, exist_ok=False)
-    with click.progressbar(
-        measurements, label="Plotting measurements", show_pos=True
-    ) as measurements:
-        for m in measurements:
-            _plot_flux_fit(m, plot_dir, conf)
+    jobs = ((m, plot_dir, conf) for m in _iter_measurements(db, conf))
+    for _ in _map_with_progressbar(
+        _plot_flux_fit_job,
+        jobs,
+        length=_count_measurements(db, conf),
+        label="Plotting measurements",
+        singlecore=singlecore,
+    ):
+        pass
+
+
+def _map_with_progressbar(
+    func: Callable[[Any], T],
+    items: Iterable[Any],
+    length: int,
+    label: str,
+    singlecore: bool,
+    chunksize: int = 4,
+    threads: bool = False,
+) -> Iterator[T]:
+    """
+    Like `map(func, items)` but showing a progress bar of `length` steps.
+
+    Unless `singlecore` is set, the work is spread over a process pool. In that case
+    `func` and `items` must be picklable.
+
+    If `threads` is set, a thread pool is used instead of a process pool. This
+    avoids pickling the items and results, and suits functions that spend most
+    of their time in code that releases the GIL.
+
+    `items` is consumed lazily, so that only a bounded number of items are held
+    in memory at any time.
+    """
+    with click.progressbar(length=length, label=label, show_pos=True) as bar:
+        if singlecore:
+            for item in items:
+                yield func(item)
+                bar.update(1)
+        else:
+            items = iter(items)
+            chunks = iter(lambda: list(itertools.islice(items, chunksize)), [])
+            executor_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+            with executor_class() as executor:
+                max_pending = 2 * (os.cpu_count() or 1)
+                pending = collections.deque(
+                    executor.submit(_map_chunk, func, chunk)
+                    for chunk in itertools.islice(chunks, max_pending)
+                )
+                while pending:
+                    results = pending.popleft().result()
+                    for chunk in itertools.islice(chunks, 1):
+                        pending.append(executor.submit(_map_chunk, func, chunk))
+                    yield from results
+                    bar.update(len(results))
+
+
+def _map_chunk(func: Callable[[Any], T], items: List[Any]) -> List[T]:
+    return [func(item) for item in items]
+
+
+def _plot_flux_fit_job(job: Tuple[pd.DataFrame, Path, Config]):
+    _plot_flux_fit(*job)
 
 
 def _plot_flux_fit(measurement: pd.DataFrame, dst_dir: Path, conf: Config):
@@ -234,11 +408,12 @@ def _plot_flux_fit(measurement: pd.DataFrame, dst_dir: Path, conf: Config):
         raise click.ClickException("The config file has no section [measurements].")
     if conf.fluxes is None:
         raise click.ClickException("The config file has no section [fluxes].")
-    (chamber_value,) = measurement[conf.measurements.chamber_col].unique()
+    chamber_value = measurement[conf.measurements.chamber_col].iat[0]
 
-    flux_estimates_by_gas = {
-        gas: _estimate_vol_flux(measurement, gas, conf) for gas in conf.fluxes.gases
-    }
+    # Imported here, so that the commands that don't plot need not import matplotlib
+    from opentoolflux.plot import plot_measurement
+
+    flux_estimates_by_gas = _estimate_vol_fluxes(measurement, conf)
 
     fig = plot_measurement(
         measurement,
@@ -248,13 +423,13 @@ def _plot_flux_fit(measurement: pd.DataFrame, dst_dir: Path, conf: Config):
     )
     plot_path = dst_dir / _build_measurement_file_name(measurement, conf, ".png")
     fig.savefig(plot_path)
-    plt.close(fig)
 
 
 @plot.command()
 @click.pass_context
+@singlecore_option
 @require_database_file
-def flux_time_series(ctx: click.Context):
+def flux_time_series(ctx: click.Context, singlecore: bool):
     """
     Estimate fluxes and create time-series figures with fluxes for each chamber.
 
@@ -264,10 +439,15 @@ def flux_time_series(ctx: click.Context):
 
     Pre-existing flux time series figures are automatically removed by this command.
     """
+    # Imported here, so that the commands that don't plot need not import matplotlib
+    from opentoolflux.plot import plot_time_series
+
     conf: Config = ctx.obj["config"]
     if conf.fluxes is None:
         raise click.ClickException("The config file has no section [fluxes].")
-    fluxes = _estimate_fluxes_result_table(_iter_measurements(conf), conf)
+    fluxes = _estimate_fluxes_result_table(
+        _get_filtered_db(ctx), conf, singlecore=singlecore
+    )
     plot_dir = conf.general.outdir / _PLOTS_SUBDIR / "flux-time-series"
     if plot_dir.exists():
         shutil.rmtree(plot_dir)
@@ -279,122 +459,176 @@ def flux_time_series(ctx: click.Context):
         plot_path = plot_dir / f"{chamber_label}.png"
         fig = plot_time_series(chamber_data, conf.fluxes.gases, title=title)
         fig.savefig(plot_path)
-        plt.close(fig)
 
 
-def _get_chamber_labels_series(
-    chamber_values: pd.Series, chamber_labels: Optional[ChamberLabels]
-) -> pd.Series:
+def _get_chamber_label(
+    chamber_value: Union[int, float, bool, str],
+    chamber_labels: Optional[ChamberLabels],
+) -> str:
     if chamber_labels is None:
-        return chamber_values.astype(str)
-
-    replacements = pd.Series(chamber_labels)
-    replacements.index = replacements.index.astype(chamber_values.dtype)
-
-    requested_values = (
-        set(chamber_values.unique())
-        if isinstance(chamber_values, pd.Series)
-        else {chamber_values}
-    )
-    values_with_labels = set(replacements.index)
-    missing = requested_values - values_with_labels
-    if missing:
+        return str(chamber_value)
+
+    dtype = getattr(chamber_value, "dtype", None)
+    if dtype is None:
+        dtype = pd.Index([chamber_value]).dtype
+    labels = _get_chamber_labels_dict(chamber_labels, dtype)
+    if chamber_value not in labels:
+        missing = {chamber_value}
         raise click.UsageError(f"No chamber label specified for chambers {missing!r}")
+    return str(labels[chamber_value])
 
-    if isinstance(chamber_values, pd.Series):
-        return chamber_values.replace(replacements).astype(str)
-    else:
-        return replacements[chamber_values]
 
+def _get_chamber_labels_dict(chamber_labels: ChamberLabels, dtype) -> Dict[Any, str]:
+    # Called once per measurement, so the conversion is cached.
+    return _convert_chamber_labels(tuple(chamber_labels.items()), dtype)
 
-def _get_chamber_label(
-    chamber_value: Union[int, float, bool, str],
-    chamber_labels: Optional[ChamberLabels],
-):
-    return _get_chamber_labels_series(pd.Series([chamber_value]), chamber_labels)[0]
+
+@functools.lru_cache(maxsize=None)
+def _convert_chamber_labels(
+    chamber_labels: Tuple[Tuple[str, ChamberLabel], ...], dtype
+) -> Dict[Any, str]:
+    # The config keys are strings; coerce them to the chamber column's dtype
+    # so that lookups by chamber value hit.
+    keys = pd.Index([key for key, _ in chamber_labels]).astype(dtype)
+    return dict(zip(keys, (label for _, label in chamber_labels)))
 
 
 def _build_measurement_file_name(measurement: pd.DataFrame, conf: Config, suffix: str):
     if conf.measurements is None:
         raise click.ClickException("The config file has no section [measurements].")
-    (chamber_value,) = measurement[conf.measurements.chamber_col].unique()
+    chamber_value = measurement[conf.measurements.chamber_col].iat[0]
     chamber_label = _get_chamber_label(chamber_value, conf.chamber_labels)
     data_start = measurement.index[0]
     return f"{chamber_label}-{data_start:%Y%m%d-%H%M%S}{suffix}"
 
 
-def _estimate_vol_flux(measurement: pd.DataFrame, gas: str, conf: Config):
+def _estimate_vol_fluxes(
+    measurement: pd.DataFrame, conf: Config
+) -> Dict[str, VolFluxEstimate]:
     assert conf.measurements is not None
     assert conf.fluxes is not None
+    chamber_value = measurement[conf.measurements.chamber_col].iat[0]
 
-    if isinstance(conf.fluxes.t0_delay, datetime.timedelta):
-        # If a single t0_delay is used for all chambers
-        t0_delay = conf.fluxes.t0_delay
-    else:
-        (chamber_value,) = measurement[conf.measurements.chamber_col].unique()
-        assert isinstance(chamber_value, (float, int, bool, str))
-        type_ = type(chamber_value)
-        t0_delays = _convert_str_keys(conf.fluxes.t0_delay, type_)
-        if chamber_value not in t0_delays:
-            raise click.ClickException(
-                f"t0_delay not defined for chamber {chamber_value}"
-            )
-        t0_delay = t0_delays[chamber_value]
-
-    return estimate_vol_flux(
-        measurement[gas],
-        t0_delay=t0_delay,
+    return estimate_vol_fluxes(
+        measurement,
+        conf.fluxes.gases,
+        t0_delay=_get_t0_delay(chamber_value, conf),
         t0_margin=conf.fluxes.t0_margin,
         tau_s=conf.fluxes.tau_s,
         h=conf.fluxes.h,
     )
 
 
-def _estimate_fluxes_result_table(measurements: Iterable[pd.DataFrame], conf: Config):
+def _get_t0_delay(
+    chamber_value: Union[int, float, bool, str], conf: Config
+) -> datetime.timedelta:
+    assert conf.fluxes is not None
+
+    if isinstance(conf.fluxes.t0_delay, datetime.timedelta):
+        # If a single t0_delay is used for all chambers
+        return conf.fluxes.t0_delay
+
+    assert isinstance(chamber_value, (float, int, bool, str))
+    type_ = type(chamber_value)
+    t0_delays = _convert_str_keys(conf.fluxes.t0_delay, type_)
+    if chamber_value not in t0_delays:
+        raise click.ClickException(f"t0_delay not defined for chamber {chamber_value}")
+    return t0_delays[chamber_value]
+
+
+def _estimate_fluxes_result_table(
+    db: pd.DataFrame, conf: Config, singlecore: bool = False
+) -> pd.DataFrame:
+    return pd.DataFrame.from_records(
+        list(_iter_flux_rows(db, conf, singlecore=singlecore)),
+        columns=_FLUXES_COLUMNS_ORDER,
+    )
+
+
+def _iter_flux_rows(
+    db: pd.DataFrame, conf: Config, singlecore: bool = False
+) -> Iterator[Dict[str, Any]]:
     if conf.measurements is None:
         raise click.ClickException("The config file has no section [measurements].")
     if conf.fluxes is None:
         raise click.ClickException("The config file has no section [fluxes].")
 
-    def build_row(measurement: pd.DataFrame, gas: database.Colname):
-        flux_est = _estimate_vol_flux(measurement, gas, conf)
+    # The measurements are counted up front to show the progress, so that they can
+    # be analyzed one by one without keeping a second copy of the database in memory.
+    # They are passed around as NumPy arrays rather than DataFrames, since the
+    # per-measurement overhead of pandas dominates when measurements are short.
+    jobs = (
+        (measurement, conf)
+        for measurement in measurements.iter_measurement_arrays(
+            db,
+            conf.measurements.chamber_col,
+            conf.fluxes.gases,
+            conf.measurements.max_gap,
+            conf.measurements.min_duration,
+            conf.measurements.max_duration,
+        )
+    )
+    num_measurements = 0
+    num_fluxes = 0
+    # Fitting a measurement is fast compared to sending it to a worker process,
+    # so the measurements are sent in larger chunks than the default.
+    for rows in _map_with_progressbar(
+        _build_flux_rows,
+        jobs,
+        length=_count_measurements(db, conf),
+        label="Analyzing measurements",
+        singlecore=singlecore,
+        chunksize=16,
+    ):
+        num_measurements += 1
+        num_fluxes += len(rows)
+        yield from rows
 
-        assert conf.measurements
-        (chamber_value,) = measurement[conf.measurements.chamber_col].unique()
+    logger.info(
+        f"Estimated {num_fluxes} fluxes ({', '.join(conf.fluxes.gases)}) "
+        f"in {num_measurements} measurements."
+    )
 
-        result_row = {
-            **flux_est,
-            "chamber_value": chamber_value,
-            "chamber_label": _get_chamber_label(chamber_value, conf.chamber_labels),
-            "gas": gas,
-        }
 
-        return result_row
-
-    # The click.progressbar(list(measurements), ...) makes a full list
-    # of all measurements, which increases memory consumption compared the iterator,
-    # for the purpose of being able to know the progress.
-    # However, this is only one of several places in the source code that
-    # requires 2x full database in memory.
-    with click.progressbar(
-        list(measurements), label="Analyzing measurements", show_pos=True
-    ) as measurements:
-        result_table = pd.DataFrame.from_records(
-            [
-                build_row(measurement, gas)
-                for measurement in measurements
-                for gas in conf.fluxes.gases
-            ]
+def _format_flux_row(row: Mapping[str, Any]) -> Dict[str, Any]:
+    # Timestamps are always written with microseconds, so that all rows have the
+    # same format (pandas picks the precision based on the whole column).
+    return {
+        key: (
+            value.isoformat(sep=" ", timespec="microseconds")
+            if isinstance(value, datetime.datetime)
+            else value
         )
+        for key, value in row.items()
+        if key in _FLUXES_COLUMNS_ORDER
+    }
 
-    result_table = result_table[_FLUXES_COLUMNS_ORDER]
 
-    logger.info(
-        f"Estimated {len(result_table)} fluxes ({', '.join(conf.fluxes.gases)}) "
-        f"in {result_table['t0'].nunique()} measurements."
+def _build_flux_rows(
+    job: Tuple[measurements.MeasurementArrays, Config]
+) -> List[Dict[str, Any]]:
+    measurement, conf = job
+    assert conf.fluxes is not None
+    chamber_value = measurement.chamber_value
+    chamber_label = _get_chamber_label(chamber_value, conf.chamber_labels)
+    estimates = estimate_vol_fluxes_from_arrays(
+        measurement.timestamps,
+        measurement.columns,
+        t0_delay=_get_t0_delay(chamber_value, conf),
+        t0_margin=conf.fluxes.t0_margin,
+        tau_s=conf.fluxes.tau_s,
+        h=conf.fluxes.h,
     )
 
-    return result_table
+    return [
+        {
+            **estimate,
+            "chamber_value": chamber_value,
+            "chamber_label": chamber_label,
+            "gas": gas,
+        }
+        for gas, estimate in estimates.items()
+    ]
 
 
 _FLUXES_COLUMNS_ORDER = [
@@ -408,11 +642,38 @@ _FLUXES_COLUMNS_ORDER = [
 ]
 
 
-def _iter_measurements(conf: Config):
+def _get_filtered_db(ctx: click.Context) -> pd.DataFrame:
+    """
+    Read and filter the database.
+
+    Only the columns used for filtering, measurements, and fluxes are read.
+
+    The result is kept in `ctx.obj`, so that the database file is read only once
+    per invocation no matter how many times the measurements are iterated.
+    """
+    if "filtered_db" not in ctx.obj:
+        conf: Config = ctx.obj["config"]
+        if conf.measurements is None:
+            raise click.ClickException("The config file has no section [measurements].")
+        columns = [
+            conf.measurements.chamber_col,
+            *conf.filters,
+            *(conf.fluxes.gases if conf.fluxes else []),
+        ]
+        db = database.read_db(_get_db_path(conf), columns)
+        ctx.obj["filtered_db"] = measurements.filter_db(db, conf.filters)
+    return ctx.obj["filtered_db"]
+
+
+def _iter_measurements(db: pd.DataFrame, conf: Config) -> Iterator[pd.DataFrame]:
+    """
+    Iterate over the measurements in `db`.
+
+    All rows of a measurement have the same chamber value, so the chamber value
+    can be read from the first row.
+    """
     if conf.measurements is None:
         raise click.ClickException("The config file has no section [measurements].")
-    db = database.read_db(_get_db_path(conf))
-    db = measurements.filter_db(db, conf.filters)
     yield from measurements.iter_measurements(
         db,
         conf.measurements.chamber_col,
@@ -422,6 +683,18 @@ def _iter_measurements(conf: Config):
     )
 
 
+def _count_measurements(db: pd.DataFrame, conf: Config) -> int:
+    if conf.measurements is None:
+        raise click.ClickException("The config file has no section [measurements].")
+    return measurements.count_measurements(
+        db,
+        conf.measurements.chamber_col,
+        conf.measurements.max_gap,
+        conf.measurements.min_duration,
+        conf.measurements.max_duration,
+    )
+
+
 def _get_db_path(conf: Config) -> Path:
     return conf.general.outdir / _DB_FILENAME
 
@@ -511,6 +784,7 @@ class Config(pydantic.BaseModel):
         return cls.parse_obj(obj)
 
 
+T = TypeVar("T")
 KT = TypeVar("KT")
 VT = TypeVar("VT")
 
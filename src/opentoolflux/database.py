@@ -1,13 +1,21 @@
 from __future__ import annotations
 
+import csv
 import glob
+import hashlib
 import itertools
 import logging
-from io import StringIO
+from io import BytesIO, StringIO
 from pathlib import Path
-from typing import List, Literal, Mapping, Union
+from typing import Iterable, List, Literal, Mapping, Optional, Sequence, Union
 
+import numpy as np
 import pandas as pd
+import pyarrow
+import pyarrow.csv
+import pyarrow.feather
+
+import opentoolflux
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +23,12 @@ TIMESTAMP_COLUMN = "__TIMESTAMP__"
 MICROSECONDS_PER_SECOND = 1e6
 MICROSECOND_NUMPY_TIMESTAMP = "datetime64[us]"
 NANOSECOND_NUMPY_TIMESTAMP = "datetime64[ns]"
+FEATHER_COMPRESSION = "zstd"
+FEATHER_COMPRESSION_LEVEL = 3
+FEATHER_CHUNKSIZE = 64 * 1024
+# Part of the key of cached source files; bump it when the parsing changes, so that
+# files parsed by an older version of this code are not reused.
+_SRC_CACHE_FORMAT_VERSION = 2
 
 Colname = str
 DTypeName = Literal[
@@ -34,6 +48,49 @@ DTypeName = Literal[
 ]
 DTypes = Mapping[Colname, DTypeName]
 
+# Data types used by pyarrow to parse text data. Integers and floats are parsed
+# as 64-bit and then converted, to behave the same as the pandas parser (e.g.,
+# integer overflow wraps around and float16 is supported).
+_ARROW_PARSE_TYPES: Mapping[DTypeName, pyarrow.DataType] = {
+    "uint8": pyarrow.int64(),
+    "uint16": pyarrow.int64(),
+    "uint32": pyarrow.int64(),
+    "uint64": pyarrow.uint64(),
+    "int8": pyarrow.int64(),
+    "int16": pyarrow.int64(),
+    "int32": pyarrow.int64(),
+    "int64": pyarrow.int64(),
+    "float16": pyarrow.float64(),
+    "float32": pyarrow.float64(),
+    "float64": pyarrow.float64(),
+    "bool": pyarrow.bool_(),
+    "str": pyarrow.string(),
+}
+
+
+# The strings read as missing values by the pandas parser (by default).
+_PANDAS_NA_VALUES = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+
 
 def create_empty_db(dtypes: DTypes, timestamp_col: Colname) -> pd.DataFrame:
     return _dataframe_to_db(
@@ -59,35 +116,207 @@ def read_src_file(
     Return data sorted by the index col ascending.
     """
     logger.debug(f"Reading '{path_or_buffer}'.")
+    # The pyarrow parser is much faster (multithreaded) than the pandas parser,
+    # but it supports only single-character delimiters, not regular expressions
+    # such as r"\s+". It is also stricter, e.g., it does not accept rows with
+    # missing fields, so the pandas parser is used as fallback. On the other hand,
+    # it is more lenient with some numbers: it reads hexadecimal integers such as
+    # "0x10", and floats out of range such as "1e400" as inf, where the pandas
+    # parser raises an error.
+    if len(sep) == 1:
+        start = path_or_buffer.tell() if isinstance(path_or_buffer, StringIO) else 0
+        try:
+            data = _read_csv_with_pyarrow(path_or_buffer, dtypes, sep)
+        except pyarrow.ArrowException as e:
+            logger.debug(f"Falling back on the pandas parser: {e}")
+            if isinstance(path_or_buffer, StringIO):
+                path_or_buffer.seek(start)
+        else:
+            return _dataframe_to_db(data, timestamp_col)
     columns = list(dtypes)
     data = pd.read_csv(path_or_buffer, sep=sep, dtype=dtypes, usecols=columns)
     return _dataframe_to_db(data, timestamp_col)
 
 
+def read_src_file_cached(
+    path: Path,
+    dtypes: DTypes,
+    timestamp_col: Colname,
+    sep: str,
+    cache_dir: Path,
+) -> pd.DataFrame:
+    """
+    Like `read_src_file`, but reuse the data parsed by an earlier call if neither the
+    file (its path, modification time and size) nor the parsing options have changed.
+
+    The parsed data are cached as Feather files in `cache_dir`.
+    """
+    cache_path = _get_src_file_cache_path(path, dtypes, timestamp_col, sep, cache_dir)
+    try:
+        table = pyarrow.feather.read_table(cache_path)
+    except FileNotFoundError:
+        pass
+    except (OSError, pyarrow.ArrowInvalid) as e:
+        logger.debug(f"Ignoring unreadable cache file '{cache_path}': {e}")
+    else:
+        logger.debug(f"Using cached data for '{path}'.")
+        return _table_to_db(table)
+
+    data = read_src_file(path, dtypes, timestamp_col, sep)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so that an interrupted write never leaves
+        # a truncated cache file behind.
+        tmp_path = cache_path.with_suffix(".tmp")
+        _write_feather(data, tmp_path)
+        tmp_path.replace(cache_path)
+    except OSError as e:
+        logger.debug(f"Could not cache data for '{path}' in '{cache_path}': {e}")
+    return data
+
+
+def prune_src_file_cache(
+    cache_dir: Path,
+    paths: Iterable[Path],
+    dtypes: DTypes,
+    timestamp_col: Colname,
+    sep: str,
+):
+    """
+    Remove all files from `cache_dir` except the cached data of `paths`, i.e., data
+    of source files which have since changed or are no longer imported.
+
+    Use a separate `cache_dir` for each set of source files, since the cached data of
+    any other source files are removed too.
+    """
+    keep = {
+        _get_src_file_cache_path(path, dtypes, timestamp_col, sep, cache_dir)
+        for path in paths
+    }
+    for cache_path in cache_dir.glob("*"):
+        if cache_path not in keep:
+            logger.debug(f"Removing stale cache file '{cache_path}'.")
+            cache_path.unlink(missing_ok=True)
+
+
+def _get_src_file_cache_path(
+    path: Path, dtypes: DTypes, timestamp_col: Colname, sep: str, cache_dir: Path
+) -> Path:
+    stat = path.stat()
+    key = (
+        _SRC_CACHE_FORMAT_VERSION,
+        opentoolflux.__version__,
+        pd.__version__,
+        pyarrow.__version__,
+        str(path.resolve()),
+        stat.st_mtime_ns,
+        stat.st_size,
+        tuple(dtypes.items()),
+        timestamp_col,
+        sep,
+    )
+    return cache_dir / f"{hashlib.blake2s(repr(key).encode()).hexdigest()}.feather"
+
+
+def _read_csv_with_pyarrow(
+    path_or_buffer: Union[Path, StringIO], dtypes: DTypes, sep: str
+) -> pd.DataFrame:
+    if isinstance(path_or_buffer, StringIO):
+        text = path_or_buffer.read()
+        src = BytesIO(text.encode())
+        header = text.partition("\n")[0].lstrip("\ufeff")
+    else:
+        src = str(path_or_buffer)
+        with open(path_or_buffer, encoding="utf-8-sig", errors="replace") as f:
+            header = f.readline()
+    table = pyarrow.csv.read_csv(
+        src,
+        parse_options=pyarrow.csv.ParseOptions(delimiter=sep),
+        convert_options=pyarrow.csv.ConvertOptions(
+            include_columns=list(dtypes),
+            column_types={
+                colname: _ARROW_PARSE_TYPES[dtype] for colname, dtype in dtypes.items()
+            },
+            null_values=_PANDAS_NA_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+    for colname, dtype in dtypes.items():
+        # Like the pandas parser, refuse to guess a value for missing booleans.
+        if dtype == "bool" and table.column(colname).null_count:
+            raise ValueError(f"Bool column has NA values in column '{colname}'")
+
+    # pyarrow returns the columns in the order of `include_columns`; reorder them
+    # as in the file, like the pandas parser does.
+    file_order = {
+        colname: i
+        for i, colname in enumerate(
+            next(csv.reader([header.rstrip("\r\n")], delimiter=sep), [])
+        )
+    }
+    table = table.select(
+        sorted(table.column_names, key=lambda c: file_order.get(c, len(file_order)))
+    )
+
+    # Missing strings are None from pyarrow, but NaN from the pandas parser.
+    str_colnames_with_nulls = [
+        colname
+        for colname, dtype in dtypes.items()
+        if dtype == "str" and table.column(colname).null_count
+    ]
+    # Columns which already have the right dtype (e.g., float64) are not copied.
+    data = table.to_pandas(self_destruct=True).astype(
+        {colname: dtype for colname, dtype in dtypes.items() if dtype != "str"},
+        copy=False,
+    )
+    for colname in str_colnames_with_nulls:
+        # Not fillna(), which would downcast a column of only missing values to float.
+        data[colname] = data[colname].to_numpy(dtype=object, na_value=np.nan)
+    return data
+
+
 def find_files(glob_patterns: list[str]) -> List[Path]:
-    return sorted(
-        set(
-            map(
-                Path,
-                itertools.chain(
-                    *(glob.iglob(pattern, recursive=True) for pattern in glob_patterns)
-                ),
-            )
+    # Overlapping patterns can match the same file many times. Deduplicate the
+    # matches as strings first, which is cheaper than creating and hashing a Path
+    # for every match. (Different strings can still be the same Path, e.g.,
+    # "./a.dat" and "a.dat", so the Paths are deduplicated too.)
+    matches = set(
+        itertools.chain.from_iterable(
+            glob.iglob(pattern, recursive=True) for pattern in glob_patterns
         )
     )
+    return sorted(set(map(Path, matches)))
 
 
 def _dataframe_to_db(data: pd.DataFrame, timestamp_col: Colname) -> pd.DataFrame:
-    data[TIMESTAMP_COLUMN] = convert_datetime(data[timestamp_col])
-    del data[timestamp_col]
-    data.set_index(TIMESTAMP_COLUMN, inplace=True)
-    data.sort_index(inplace=True)
-    if not data.index.is_unique:
-        first_duplicate = data.index[data.index.duplicated()][0]
+    timestamps = convert_datetime(data.pop(timestamp_col)).to_numpy()
+    data.index = pd.DatetimeIndex(timestamps, name=TIMESTAMP_COLUMN)
+    # Source files are normally sorted already. Then a single comparison of
+    # neighbors shows that the timestamps are both sorted and unique.
+    if (timestamps[1:] > timestamps[:-1]).all():
+        return data
+    order = np.argsort(timestamps, kind="stable")
+    data = data.take(order)
+    is_duplicate = _is_equal_to_next(timestamps[order])
+    if is_duplicate.any():
+        first_duplicate = data.index[1:][is_duplicate][0]
         raise ValueError(f"Duplicate timestamp {first_duplicate}")
     return data
 
 
+def _is_equal_to_next(timestamps: np.ndarray) -> np.ndarray:
+    """
+    Compare each of the sorted `timestamps` to the next one.
+
+    Missing timestamps (NaT) never compare equal, but they are sorted last and
+    count as duplicates of each other here, like in `pandas.Index.duplicated`.
+    """
+    is_equal = timestamps[1:] == timestamps[:-1]
+    is_missing = np.isnat(timestamps)
+    is_equal |= is_missing[1:] & is_missing[:-1]
+    return is_equal
+
+
 def convert_datetime(s: pd.Series) -> pd.Series:
     """
     Convert pandas.Series to datetime[ns].
@@ -115,25 +344,39 @@ def convert_datetime(s: pd.Series) -> pd.Series:
         # (4) convert to int64
         #
         # For this reason, let's require that floating-point timestamps are float64.
+        #
+        # Steps (2) and (3) are done in place on a single NumPy buffer, to avoid
+        # allocating a new pandas.Series for each step.
         if s.dtype != "float64":
             raise ValueError(
                 f"floating-point timestamp data must be float64 (found {s.dtype})"
             )
-        return (
-            s.astype("float64")
-            .mul(MICROSECONDS_PER_SECOND)
-            .round()
-            .astype(MICROSECOND_NUMPY_TIMESTAMP)
-            .astype(NANOSECOND_NUMPY_TIMESTAMP)
+        microseconds = s.to_numpy(dtype=np.float64, copy=True)
+        microseconds *= MICROSECONDS_PER_SECOND
+        np.rint(microseconds, out=microseconds)
+        return pd.Series(
+            microseconds.astype(MICROSECOND_NUMPY_TIMESTAMP).astype(
+                NANOSECOND_NUMPY_TIMESTAMP
+            ),
+            index=s.index,
+            name=s.name,
         )
     elif s.dtype.kind in {"i", "u"}:
-        # Integers can be converted directly
-        return s.astype(NANOSECOND_NUMPY_TIMESTAMP)
+        # Integers can be converted directly. For int64 data this is a zero-copy
+        # view of the input buffer.
+        return pd.Series(
+            s.to_numpy(dtype=np.int64).view(NANOSECOND_NUMPY_TIMESTAMP),
+            index=s.index,
+            name=s.name,
+        )
     elif s.dtype.kind in {"O"}:
-        return (
-            pd.to_datetime(s, utc=True, format="ISO8601")
-            .dt.tz_localize(None)
-            .astype(NANOSECOND_NUMPY_TIMESTAMP)
+        # Parse into a DatetimeIndex rather than a Series, so that converting to
+        # naive UTC does not go through the .dt accessor and its extra copies.
+        timestamps = pd.to_datetime(s.to_numpy(), utc=True, format="ISO8601")
+        return pd.Series(
+            timestamps.tz_convert(None).astype(NANOSECOND_NUMPY_TIMESTAMP, copy=False),
+            index=s.index,
+            name=s.name,
         )
     else:
         raise NotImplementedError(f"Cannot make datetime from dtype {s.dtype}.")
@@ -150,19 +393,76 @@ def update(original: pd.DataFrame, *databases: pd.DataFrame) -> pd.DataFrame:
                 lambda x: x["lhs"] != x["rhs"]
             ]
             raise ValueError(f"Conflicting dtypes: {diff}")
-    concatenated = pd.concat([original, *databases]).sort_index()
-    return concatenated[~concatenated.index.duplicated(keep="last")]
+    return combine([original, *databases])
+
+
+def combine(databases: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Combine databases into one, like `update` but without validation.
 
+    The databases must have the same columns and dtypes. Where timestamps overlap,
+    later databases take precedence.
+    """
+    combined = pd.concat(databases)
+    # In the common case (e.g., source files with consecutive time ranges) the
+    # concatenation is already sorted and unique, and then no further copies of
+    # the data are made.
+    if not combined.index.is_monotonic_increasing:
+        # The databases are normally sorted already, so a stable sort (timsort) of
+        # the concatenation is close to a linear-time merge. Being stable, it also
+        # keeps rows from later databases last among rows with the same timestamp.
+        combined = combined.sort_index(kind="stable")
+    # Now duplicate timestamps are adjacent, so they can be found by comparing
+    # neighbors instead of hashing the whole index. Keep the last of each run of
+    # duplicates, i.e., the row from the latest database.
+    is_overridden = _is_equal_to_next(combined.index.to_numpy())
+    if is_overridden.any():
+        combined = combined[~np.append(is_overridden, False)]
+    return combined
+
+
+def read_db(path: Path, columns: Optional[Iterable[Colname]] = None) -> pd.DataFrame:
+    """
+    Read the database at `path`.
 
-def read_db(path: Path) -> pd.DataFrame:
+    If `columns` is given, only those columns (and the timestamps) are read.
+    """
     logger.info(f"Reading database from '{path}' ({_get_file_size_MiB(path):.1f} MiB).")
-    return pd.read_feather(path).set_index(TIMESTAMP_COLUMN)
+    if columns is not None:
+        columns = list(dict.fromkeys([TIMESTAMP_COLUMN, *columns]))
+    table = pyarrow.feather.read_table(path, columns=columns, memory_map=True)
+    return _table_to_db(table)
+
+
+def _table_to_db(table: pyarrow.Table) -> pd.DataFrame:
+    # The timestamps are made the index directly, instead of converting them as a
+    # column and then calling set_index, which would copy all the other columns.
+    timestamps = table.column(TIMESTAMP_COLUMN).to_numpy()
+    table = table.select(
+        [colname for colname in table.column_names if colname != TIMESTAMP_COLUMN]
+    )
+    # Not using split_blocks=True here, since it may give zero-copy views into the
+    # memory-mapped file, which would break if the file is later overwritten.
+    db = table.to_pandas(self_destruct=True)
+    db.index = pd.DatetimeIndex(timestamps, name=TIMESTAMP_COLUMN)
+    return db
 
 
 def save_db(db: pd.DataFrame, path: Path):
-    db.reset_index().to_feather(path)
+    _write_feather(db, path)
     logger.info(f"Saved database to '{path}' ({_get_file_size_MiB(path):.1f} MiB).")
 
 
+def _write_feather(db: pd.DataFrame, path: Path):
+    table = pyarrow.Table.from_pandas(db.reset_index(), preserve_index=False)
+    pyarrow.feather.write_feather(
+        table,
+        path,
+        compression=FEATHER_COMPRESSION,
+        compression_level=FEATHER_COMPRESSION_LEVEL,
+        chunksize=FEATHER_CHUNKSIZE,
+    )
+
+
 def _get_file_size_MiB(path: Path):
     return path.stat().st_size / (1024 * 1024)
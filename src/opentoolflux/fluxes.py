@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import datetime
 import logging
-from typing import Any, Mapping, TypedDict, Union
+from typing import Any, Dict, List, Mapping, Sequence, TypedDict, Union
 
 import numpy as np
 import numpy.linalg
@@ -10,6 +10,8 @@ import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+_ONE_SECOND = np.timedelta64(1, "s")
+
 
 class VolFluxEstimate(TypedDict):
     data_start: datetime.datetime
@@ -29,29 +31,76 @@ def estimate_vol_flux(
     tau_s: float,
     h: float,
 ) -> VolFluxEstimate:
+    return estimate_vol_fluxes(
+        measurement.to_frame(name="c"),
+        ["c"],
+        t0_delay=t0_delay,
+        t0_margin=t0_margin,
+        tau_s=tau_s,
+        h=h,
+    )["c"]
+
+
+def estimate_vol_fluxes(
+    measurement: pd.DataFrame,
+    gases: Sequence[str],
+    t0_delay: datetime.timedelta,
+    t0_margin: datetime.timedelta,
+    tau_s: float,
+    h: float,
+) -> Dict[str, VolFluxEstimate]:
+    """
+    Estimate the volume flux of each of several gases in one measurement.
+
+    Gives the same result as calling `estimate_vol_flux` for each gas, but the
+    time axis of the fit is only computed once per measurement.
+    """
     assert isinstance(measurement.index, pd.DatetimeIndex)
-    data_start = measurement.index[0]
-    assert isinstance(data_start, datetime.datetime)
+    return estimate_vol_fluxes_from_arrays(
+        measurement.index.to_numpy(),
+        {gas: measurement[gas].to_numpy() for gas in gases},
+        t0_delay=t0_delay,
+        t0_margin=t0_margin,
+        tau_s=tau_s,
+        h=h,
+    )
+
+
+def estimate_vol_fluxes_from_arrays(
+    timestamps: np.ndarray,
+    concentrations: Mapping[str, np.ndarray],
+    t0_delay: datetime.timedelta,
+    t0_margin: datetime.timedelta,
+    tau_s: float,
+    h: float,
+) -> Dict[str, VolFluxEstimate]:
+    """
+    Like `estimate_vol_fluxes`, but with the measurement given as NumPy arrays:
+    the sampling times (datetime64) and the concentrations of each gas.
+    """
+    data_start = pd.Timestamp(timestamps[0])
     t0 = data_start + t0_delay
-    data_analyze = measurement[
-        measurement.index >= data_start + t0_delay + t0_margin  # type: ignore
-    ]
-    assert isinstance(data_analyze.index, pd.DatetimeIndex)
-    elapsed_seconds = (data_analyze.index - t0).total_seconds()  # type: ignore
-    concentrations = data_analyze.values
-    assert isinstance(concentrations, np.ndarray)
-    c0, vol_flux = _calculate_vol_flux_from_cleaned_data(
-        elapsed_seconds, concentrations, tau_s, h
+    is_analyzed = timestamps >= (t0 + t0_margin).to_datetime64()
+    analyze_times = timestamps[is_analyzed]
+    elapsed_seconds = (analyze_times - t0.to_datetime64()) / _ONE_SECOND
+    solutions = _calculate_vol_fluxes_from_cleaned_data(
+        elapsed_seconds,
+        [values[is_analyzed] for values in concentrations.values()],
+        tau_s,
+        h,
     )
     return {
-        "data_start": data_start,
-        "t0": t0,
-        "tau_s": tau_s,
-        "h": h,
-        "fit_start": data_analyze.index[0],
-        "fit_end": data_analyze.index[-1],
-        "c0": c0,
-        "vol_flux": vol_flux,
+        gas: {
+            "data_start": data_start,
+            "t0": t0,
+            "tau_s": tau_s,
+            "h": h,
+            "fit_start": pd.Timestamp(analyze_times[0]),
+            "fit_end": pd.Timestamp(analyze_times[-1]),
+            "c0": c0,
+            "vol_flux": vol_flux,
+        }
+        for gas, (c0, vol_flux) in zip(concentrations, solutions)
     }
 
 
@@ -63,12 +112,12 @@ def predict_concentration(
     vol_flux = vol_flux_estimate["vol_flux"]
     tau_s = vol_flux_estimate["tau_s"]
     h = vol_flux_estimate["h"]
-    return c0 + vol_flux * tau_s / h * (1 - np.exp(-elapsed_s / tau_s))
+    return c0 - vol_flux * tau_s / h * np.expm1(-elapsed_s / tau_s)
 
 
-def _calculate_vol_flux_from_cleaned_data(
-    elapsed: np.ndarray, concentrations: np.ndarray, tau: float, h: float
-) -> tuple[float, float]:
+def _calculate_vol_fluxes_from_cleaned_data(
+    elapsed: np.ndarray, concentrations: Sequence[np.ndarray], tau: float, h: float
+) -> List[tuple[float, float]]:
     # The differential equation solution is
     # c(t) == c(0) + F * (tau/h) * (1 - exp(-elapsed/tau))
     #
@@ -84,9 +133,45 @@ def _calculate_vol_flux_from_cleaned_data(
     # Then it is clear that this is an equation system,
     # 1 * x0 + z * x1 = b,
     # which can be solved using linear regression (least squares).
+    #
+    # With only two parameters, the least-squares solution has a closed form:
+    # x1 = sum((z - mean(z)) * b) / sum((z - mean(z))**2)
+    # x0 = mean(b) - x1 * mean(z)
+    # This is much cheaper than a general solver such as numpy.linalg.lstsq,
+    # and centering z first avoids the cancellation problems of the textbook
+    # formula based on sum(z), sum(z**2), etc.
+    #
+    # Note that (1 - exp(-x)) is computed as -expm1(-x), which is accurate
+    # also when x is close to zero.
+    #
+    # z is computed in place in a single buffer, and the sums are computed as
+    # dot products, to avoid allocating temporary arrays.
+    #
+    # z only depends on the sampling times, so it is computed once and shared
+    # by all the concentration series (one per gas) of a measurement.
+
+    z = np.divide(elapsed, -tau, dtype=np.float64)
+    np.expm1(z, out=z)
+    z *= -tau / h
+
+    if len(z) >= 2:
+        z_mean = z.mean()
+        z -= z_mean
+        sum_squares = z @ z
+        if sum_squares > 0:
+            solutions = []
+            for b in concentrations:
+                F = (z @ b) / sum_squares
+                c0 = b.mean() - F * z_mean
+                solutions.append((c0, F))
+            return solutions
+        z += z_mean  # undo the centering before falling back
 
-    z = (tau / h) * (1 - np.exp(-elapsed / tau))
+    # Degenerate case (less than two distinct values of z); fall back on the
+    # minimum-norm solution given by the general solver.
     a = np.vstack([np.ones(len(z)), z]).T
-    b = concentrations
-    (c0, F), _, _, _ = numpy.linalg.lstsq(a, b, rcond=None)
-    return (c0, F)
+    solutions = []
+    for b in concentrations:
+        (c0, F), _, _, _ = numpy.linalg.lstsq(a, b, rcond=None)
+        solutions.append((c0, F))
+    return solutions
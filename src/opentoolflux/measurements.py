@@ -1,11 +1,9 @@
 from __future__ import annotations
 
 import datetime
-import functools
 import logging
-import operator
 from dataclasses import dataclass
-from typing import Any, Iterator, List, Mapping, Optional, TypedDict
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -23,91 +21,198 @@ class Filter:
     disallow: Optional[List[Any]] = None
 
 
-def _is_excluded_by_filter(values: pd.Series, filter_: Filter) -> pd.Series:
-    exclusion_criteria = []
+def _is_excluded_by_filter(
+    values: Union[pd.Series, pd.Index], filter_: Filter
+) -> np.ndarray:
+    # The comparisons are made by pandas rather than on the raw NumPy arrays, since
+    # pandas converts the filter values to match the column, e.g., strings such as
+    # "2022-05-09" or datetime objects to timestamps for the `__TIMESTAMP__` index.
+    excluded = np.zeros(len(values), dtype=bool)
 
     if filter_.disallow is not None:
-        exclusion_criteria.append(values.isin(filter_.disallow))
+        excluded |= np.asarray(values.isin(filter_.disallow))
     if filter_.allow_only is not None:
-        exclusion_criteria.append(~values.isin(filter_.allow_only))
+        excluded |= ~np.asarray(values.isin(filter_.allow_only))
     if filter_.min_value is not None:
-        exclusion_criteria.append(values < filter_.min_value)
+        excluded |= np.asarray(values < filter_.min_value)
     if filter_.max_value is not None:
-        exclusion_criteria.append(values > filter_.max_value)
+        excluded |= np.asarray(values > filter_.max_value)
 
-    excluded = functools.reduce(operator.or_, exclusion_criteria, False)
     return excluded
 
 
 def filter_db(
     db: pd.DataFrame, filters: Mapping[database.Colname, Filter]
 ) -> pd.DataFrame:
-    exclusions = _get_filter_exclusions(db, filters)
+    excluded, num_excluded = _get_filter_exclusions(db, filters)
     logger.info(f"Database has {len(db):,} rows.")
-    logger.info(_get_exclusions_summary(exclusions))
-    db = _apply_filter_exclusions(db, exclusions)
+    logger.info(_get_exclusions_summary(num_excluded, excluded, len(db)))
+    db = db[~excluded]
     logger.info(f"Filtered database has {len(db):,} rows.")
     return db
 
 
 def _get_filter_exclusions(
     db: pd.DataFrame, filters: Mapping[database.Colname, Filter]
-) -> pd.DataFrame:
-    db = db.reset_index()
-    return pd.DataFrame(
+) -> Tuple[np.ndarray, Dict[database.Colname, int]]:
+    """
+    Return a mask of the rows excluded by any filter, and the number of rows
+    excluded by each filter.
+    """
+    excluded = np.zeros(len(db), dtype=bool)
+    num_excluded = {}
+    for colname, filter_ in filters.items():
+        # The timestamps can be filtered too, without resetting the index.
+        values = db.index if colname == db.index.name else db[colname]
+        column_excluded = _is_excluded_by_filter(values, filter_)
+        num_excluded[colname] = int(column_excluded.sum())
+        excluded |= column_excluded
+    return excluded, num_excluded
+
+
+def _get_exclusions_summary(
+    num_excluded: Mapping[database.Colname, int], excluded: np.ndarray, num_rows: int
+) -> str:
+    counts = pd.Series({**num_excluded, "All filters combined": int(excluded.sum())})
+    summary = pd.DataFrame(
         {
-            colname: _is_excluded_by_filter(db[colname], filter_)
-            for colname, filter_ in filters.items()
+            "Number rejected": counts.apply("{:,}".format),
+            "Share rejected": (counts / num_rows).apply("{:.1%}".format),
         }
     )
+    return f"Data excluded by filters:\n{summary}\n"
 
 
-def _apply_filter_exclusions(
-    db: pd.DataFrame, exclusions: pd.DataFrame
-) -> pd.DataFrame:
-    return db[~exclusions.any(axis=1).values]
+def iter_measurements(
+    db: pd.DataFrame,
+    chamber_column: database.Colname,
+    max_gap: datetime.timedelta,
+    min_duration: datetime.timedelta,
+    max_duration: datetime.timedelta,
+) -> Iterator[pd.DataFrame]:
+    segments = _get_segments(db, chamber_column, max_gap, min_duration, max_duration)
 
+    # Convert once here rather than for each measurement.
+    db = _ensure_float64_floats(db)
+    for start, end in segments.iter_accepted():
+        yield db.iloc[start:end]
 
-def _get_exclusions_summary(exclusions: pd.DataFrame) -> str:
-    exclusions = exclusions.assign(**{"All filters combined": exclusions.any(axis=1)})
-    summary = pd.DataFrame(
-        {
-            "Number rejected": exclusions.sum().apply("{:,}".format),
-            "Share rejected": exclusions.mean().apply("{:.1%}".format),
-        }
-    )
-    return f"Data excluded by filters:\n{summary}\n"
+    _log_segments_summary(segments)
 
 
-class MeasurementMeta(TypedDict):
-    duration: datetime.timedelta
-    accept: bool
+@dataclass
+class MeasurementArrays:
+    """
+    The data of one measurement, as NumPy arrays.
 
+    The arrays are views into the columns of the database, so creating them is
+    cheap compared to building a DataFrame for each measurement.
+    """
 
-def iter_measurements(
+    timestamps: np.ndarray
+    chamber_value: Any
+    columns: Dict[database.Colname, np.ndarray]
+
+
+def iter_measurement_arrays(
     db: pd.DataFrame,
     chamber_column: database.Colname,
+    columns: Sequence[database.Colname],
     max_gap: datetime.timedelta,
     min_duration: datetime.timedelta,
     max_duration: datetime.timedelta,
-) -> Iterator[pd.DataFrame]:
-    chamber_changed = db[chamber_column] != db[chamber_column].shift(1)
-    gap_exceeded = db.index.to_series().diff() > max_gap
-    measurement_number = (chamber_changed | gap_exceeded).cumsum()
+) -> Iterator[MeasurementArrays]:
+    """
+    Yield the same measurements as `iter_measurements`, as `MeasurementArrays`.
+
+    Only the given columns are included. Like in `iter_measurements`, float
+    columns are converted to float64.
+    """
+    segments = _get_segments(db, chamber_column, max_gap, min_duration, max_duration)
+
+    timestamps = db.index.to_numpy()
+    chamber_values = _float_to_float64(db[chamber_column].to_numpy())
+    arrays = {col: _float_to_float64(db[col].to_numpy()) for col in columns}
+
+    for start, end in segments.iter_accepted():
+        yield MeasurementArrays(
+            timestamps=timestamps[start:end],
+            chamber_value=chamber_values[start],
+            columns={col: array[start:end] for col, array in arrays.items()},
+        )
+
+    _log_segments_summary(segments)
 
-    measurement_metas: list[MeasurementMeta] = []
 
-    for _, measurement in db.groupby(measurement_number):
-        assert isinstance(measurement.index, pd.DatetimeIndex)
-        duration = measurement.index[-1] - measurement.index[0]  # type: ignore
-        assert isinstance(duration, datetime.timedelta), measurement.index
-        accept = min_duration <= duration <= max_duration
-        measurement_metas.append({"duration": duration, "accept": accept})
+def count_measurements(
+    db: pd.DataFrame,
+    chamber_column: database.Colname,
+    max_gap: datetime.timedelta,
+    min_duration: datetime.timedelta,
+    max_duration: datetime.timedelta,
+) -> int:
+    """
+    Count the measurements that `iter_measurements` would yield, without
+    building the measurement data.
+    """
+    segments = _get_segments(db, chamber_column, max_gap, min_duration, max_duration)
+    return int(segments.accepted.sum())
+
 
-        if accept:
-            yield _ensure_float64_floats(measurement)
+@dataclass
+class _Segments:
+    """
+    Contiguous runs of rows in the database, which are measurement candidates.
 
-    logger.info(f"\n{_get_measurements_summary(measurement_metas)}\n")
+    Segment number i is the rows `starts[i]:ends[i]`.
+    """
+
+    starts: np.ndarray
+    ends: np.ndarray
+    durations: pd.TimedeltaIndex
+    accepted: np.ndarray
+
+    def iter_accepted(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.starts[self.accepted], self.ends[self.accepted])
+
+
+def _get_segments(
+    db: pd.DataFrame,
+    chamber_column: database.Colname,
+    max_gap: datetime.timedelta,
+    min_duration: datetime.timedelta,
+    max_duration: datetime.timedelta,
+) -> _Segments:
+    # The segments are contiguous, so they are found from the positions where
+    # a new segment starts, without the hashing of a groupby.
+    is_start = _is_measurement_start(db, chamber_column, max_gap)
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], len(db))[: len(starts)]
+    timestamps = db.index.to_numpy()
+    durations = pd.TimedeltaIndex(timestamps[ends - 1] - timestamps[starts])
+    accepted = np.asarray((min_duration <= durations) & (durations <= max_duration))
+    return _Segments(starts, ends, durations, accepted)
+
+
+def _log_segments_summary(segments: _Segments):
+    summary = _get_measurements_summary(segments.durations, segments.accepted)
+    logger.info(f"\n{summary}\n")
+
+
+def _is_measurement_start(
+    db: pd.DataFrame,
+    chamber_column: database.Colname,
+    max_gap: datetime.timedelta,
+) -> np.ndarray:
+    # Computed on the raw arrays, to avoid the Series that shift() and diff()
+    # would create. Comparing datetime64 differences to a timedelta64 works
+    # whatever the time unit of the index is.
+    chamber_values = db[chamber_column].to_numpy()
+    timestamps = db.index.to_numpy()
+    is_start = np.ones(len(db), dtype=bool)
+    np.not_equal(chamber_values[1:], chamber_values[:-1], out=is_start[1:])
+    is_start[1:] |= np.diff(timestamps) > np.timedelta64(max_gap)
+    return is_start
 
 
 def _ensure_float64_floats(df: pd.DataFrame) -> pd.DataFrame:
@@ -123,31 +228,34 @@ def _ensure_float64_floats(df: pd.DataFrame) -> pd.DataFrame:
     new_dtypes = {
         key: replace_float_by_float64(value) for key, value in df.dtypes.items()
     }
+    if new_dtypes == df.dtypes.to_dict():
+        return df
 
     return df.astype(new_dtypes)  # type: ignore
 
 
-def _get_measurements_summary(metas: list[MeasurementMeta]) -> str:
-    if metas:
-        data = pd.DataFrame.from_records(metas)
-    else:
-        data = pd.DataFrame({"duration": [], "accept": []})
+def _float_to_float64(values: np.ndarray) -> np.ndarray:
+    if values.dtype.kind == "f":
+        return values.astype(np.float64, copy=False)
+    return values
+
 
+def _get_measurements_summary(
+    durations: pd.TimedeltaIndex, accepted: np.ndarray
+) -> str:
     summary = pd.DataFrame(
         {
             key: {
                 "Number of segments": f"{len(subset):,}",
                 "Average duration": _format_duration(
-                    subset["duration"].mean() if len(subset) else None
-                ),
-                "Total duration": _format_duration(
-                    subset["duration"].sum() if len(subset) else datetime.timedelta()
+                    subset.mean() if len(subset) else None
                 ),
+                "Total duration": _format_duration(subset.sum()),
             }
             for key, subset in [
-                ("All segments", data),
-                ("Rejected segments", data[~data["accept"]]),
-                ("Final measurements", data[data["accept"]]),
+                ("All segments", durations),
+                ("Rejected segments", durations[~accepted]),
+                ("Final measurements", durations[accepted]),
             ]
         }
     ).T
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import functools
 import importlib.resources as resources
 from multiprocessing.sharedctypes import Value
 from typing import Any, Iterable, Mapping, Optional, Sequence
 
 import matplotlib as mpl
-import matplotlib.pyplot as plt
+import matplotlib.style
+import numpy as np
 import pandas as pd
 from matplotlib.figure import Figure
 
@@ -13,21 +15,32 @@ from opentoolflux import fluxes
 
 from . import database
 
-# Matplotlib TkAgg backend hogs memory and crashes with too many figures:
+# Figures are created without pyplot, so that they are not kept in pyplot's global
+# figure registry (and need no GUI backend). The TkAgg backend hogs memory and
+# crashes with too many figures:
 # https://github.com/matplotlib/matplotlib/issues/21950
-mpl.use("agg")
-
-with resources.path("opentoolflux.resources", "matplotlib-style") as path:
-    mpl.style.use(path)  # pyright: reportGeneralTypeIssues=false
 
 
 _SECONDS_PER_MINUTE = 60
+_ONE_SECOND = np.timedelta64(1, "s")
 
-prop_cycle = mpl.rc_params()["axes.prop_cycle"]
-colors = prop_cycle.by_key()["color"]
 _MEASUREMENT_KWS = dict(color="k", lw=0, marker=".", markersize=2)
 _TIME_SERIES_KWS = dict(color="k", lw=0.5, ls="--", marker=".", markersize=5)
-_ESTIMATOR_COLOR = colors[1]
+
+
+# The style is applied when the first figure is made rather than on import, since
+# it is only needed for plotting and parsing the style files takes some time.
+@functools.lru_cache(maxsize=None)
+def _use_style():
+    with resources.path("opentoolflux.resources", "matplotlib-style") as path:
+        mpl.style.use(path)  # pyright: reportGeneralTypeIssues=false
+
+
+@functools.lru_cache(maxsize=None)
+def _get_estimator_color() -> str:
+    prop_cycle = mpl.rc_params()["axes.prop_cycle"]
+    colors = prop_cycle.by_key()["color"]
+    return colors[1]
 
 
 def _subplot_title(column):
@@ -40,13 +53,15 @@ def plot_measurement(
     flux_estimates: Mapping[database.Colname, Mapping[str, Any]],
     title: Optional[str] = None,
 ) -> Figure:
+    _use_style()
     # Rough calculation of height depending on number of panels;
     # nothing scientific at all and probably will break down for large numbers.
     height_per_column = 1.7
     height_extra = 1.3
     height_total = height_per_column * len(gases) + height_extra
     share_extra = height_extra / height_total
-    fig, axs = plt.subplots(
+    fig = Figure(figsize=(6.4, height_total))
+    axs = fig.subplots(
         nrows=len(gases),
         sharex=True,
         gridspec_kw=dict(
@@ -54,7 +69,6 @@ def plot_measurement(
             hspace=0.3,
             bottom=0.6 * share_extra,
         ),
-        figsize=(6.4, height_total),
     )
 
     fig.suptitle(title)
@@ -69,11 +83,16 @@ def plot_measurement(
     def calculate_elapsed(time):
         return (time - measurement_start).total_seconds() / _SECONDS_PER_MINUTE
 
+    # The elapsed times of all samples are computed once, on the raw datetime64
+    # values, and sliced for the estimator curves below.
+    times = measurement.index.to_numpy()
+    elapsed = (times - times[0]) / _ONE_SECOND / _SECONDS_PER_MINUTE
+
     for column in gases:
         ax = ax_by_column[column]
         ax.set_title(_subplot_title(column))
         ax.plot(
-            calculate_elapsed(measurement.index),
+            elapsed,
             measurement[column],
             **_MEASUREMENT_KWS,
         )
@@ -85,19 +104,28 @@ def plot_measurement(
                 f"{flux_estimate['data_start']} {measurement_start}"
             )
 
-        estimator_times = measurement.index[
-            (flux_estimate["fit_start"] <= measurement.index)
-            & (measurement.index <= flux_estimate["fit_end"])
-        ]
-        estimated_values = fluxes.predict_concentration(flux_estimate, estimator_times)
+        # The times are sorted, so the fit interval is found by binary search.
+        fit = slice(
+            np.searchsorted(
+                times, pd.Timestamp(flux_estimate["fit_start"]).to_datetime64()
+            ),
+            np.searchsorted(
+                times,
+                pd.Timestamp(flux_estimate["fit_end"]).to_datetime64(),
+                side="right",
+            ),
+        )
+        estimated_values = fluxes.predict_concentration(
+            flux_estimate, measurement.index[fit]
+        )
         ax = ax_by_column[gas]
 
         # Draw fitted function
         ax.plot(
-            calculate_elapsed(estimator_times),
+            elapsed[fit],
             estimated_values,
             lw=2,
-            color=_ESTIMATOR_COLOR,
+            color=_get_estimator_color(),
             label=f"Estimator fit",
         )
 
@@ -105,7 +133,7 @@ def plot_measurement(
         ax.axvline(
             [calculate_elapsed(flux_estimate["t0"])],
             lw=1,
-            color=_ESTIMATOR_COLOR,
+            color=_get_estimator_color(),
             linestyle="--",
             label="t0",
         )
@@ -126,6 +154,7 @@ def plot_time_series(
     gases: Sequence[database.Colname],
     title: Optional[str] = None,
 ) -> Figure:
+    _use_style()
     fluxes = fluxes.set_index(["gas", "t0"])["vol_flux"].sort_index()
 
     # Rough calculation of height depending on number of panels;
@@ -134,7 +163,8 @@ def plot_time_series(
     height_extra = 1.3
     height_total = height_per_column * len(gases) + height_extra
     share_extra = height_extra / height_total
-    fig, axs = plt.subplots(
+    fig = Figure(figsize=(6.4, height_total))
+    axs = fig.subplots(
         nrows=len(gases),
         sharex=True,
         gridspec_kw=dict(
@@ -142,7 +172,6 @@ def plot_time_series(
             hspace=0.3,
             bottom=0.6 * share_extra,
         ),
-        figsize=(6.4, height_total),
     )
 
     fig.suptitle(title)
@@ -0,0 +1,224 @@
+import datetime
+import os
+import threading
+from pathlib import Path
+
+import click
+import pandas as pd
+import pandas.testing
+import pytest
+
+import opentoolflux.cli
+import opentoolflux.database
+from opentoolflux.cli import Config, Import
+
+from .util import build_db
+
+DTYPES = {"EPOCH_TIME": "float64", "N2O": "float64"}
+
+
+def _write_src_file(path: Path, values):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = ["EPOCH_TIME N2O"] + [f"{1600000000 + i} {v}" for i, v in enumerate(values)]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def _import_config(src_glob: str) -> Import:
+    return Import(src=[src_glob], timestamp_col="EPOCH_TIME", columns=DTYPES)
+
+
+def test_src_cache_dirs_are_separate_per_config(tmp_path):
+    _write_src_file(tmp_path / "a" / "1.dat", [1.0, 2.0])
+    _write_src_file(tmp_path / "b" / "1.dat", [3.0, 4.0])
+    outdir = tmp_path / "out"
+    import_a = _import_config(str(tmp_path / "a" / "*.dat"))
+    import_b = _import_config(str(tmp_path / "b" / "*.dat"))
+    cache_dir_a = opentoolflux.cli._get_src_cache_dir(outdir, import_a)
+    cache_dir_b = opentoolflux.cli._get_src_cache_dir(outdir, import_b)
+    assert cache_dir_a != cache_dir_b
+    assert cache_dir_a == opentoolflux.cli._get_src_cache_dir(
+        outdir, _import_config(str(tmp_path / "a" / "*.dat"))
+    )
+
+    for import_, cache_dir in [(import_a, cache_dir_a), (import_b, cache_dir_b)]:
+        opentoolflux.cli._read_src_files(
+            import_.src,
+            import_.columns,
+            import_.timestamp_col,
+            import_.sep,
+            cache_dir=cache_dir,
+            singlecore=True,
+        )
+
+    # Importing with one config does not prune the cache of the other.
+    cached_a = sorted(cache_dir_a.iterdir())
+    cached_b = sorted(cache_dir_b.iterdir())
+    assert len(cached_a) == len(cached_b) == 1
+    opentoolflux.cli._read_src_files(
+        import_a.src,
+        import_a.columns,
+        import_a.timestamp_col,
+        import_a.sep,
+        cache_dir=cache_dir_a,
+        singlecore=True,
+    )
+    assert sorted(cache_dir_a.iterdir()) == cached_a
+    assert sorted(cache_dir_b.iterdir()) == cached_b
+
+
+def _square_slowly_if_small(x: int) -> int:
+    # Early items finish last, to catch results coming back out of order.
+    if x < 3:
+        threading.Event().wait(0.05)
+    return x * x
+
+
+@pytest.mark.parametrize(
+    "singlecore, threads", [(True, False), (False, True), (False, False)]
+)
+def test_map_with_progressbar(singlecore, threads):
+    items = range(23)
+    result = opentoolflux.cli._map_with_progressbar(
+        _square_slowly_if_small,
+        iter(items),
+        length=len(items),
+        label="Testing",
+        singlecore=singlecore,
+        chunksize=2,
+        threads=threads,
+    )
+    assert list(result) == [x * x for x in items]
+
+
+def test_format_flux_row():
+    timestamp = pd.Timestamp("2022-05-09 12:34:56")
+    row = {
+        "data_start": timestamp,
+        "t0": timestamp + pd.Timedelta("1.234567s"),
+        "chamber_value": 3,
+        "gas": "N2O",
+        "c0": 0.3,
+        "vol_flux": 1e-8,
+        "not_a_flux_column": 1,
+    }
+    formatted = opentoolflux.cli._format_flux_row(row)
+    assert formatted == {
+        "data_start": "2022-05-09 12:34:56.000000",
+        "t0": "2022-05-09 12:34:57.234567",
+        "chamber_value": 3,
+        "gas": "N2O",
+        "c0": 0.3,
+        "vol_flux": 1e-8,
+    }
+    for key in ["data_start", "t0"]:
+        assert datetime.datetime.fromisoformat(formatted[key]) == row[key]
+        assert pd.Timestamp(formatted[key]) == row[key]
+
+
+def _build_config(outdir: Path, **sections) -> Config:
+    return Config.parse_obj(
+        {
+            "general": {"outdir": outdir},
+            "measurements": {
+                "chamber_col": "chamber",
+                "max_gap": 10,
+                "min_duration": 0,
+                "max_duration": 100,
+            },
+            "fluxes": {
+                "gases": ["N2O"],
+                "t0_delay": 0,
+                "t0_margin": 0,
+                "A": 1,
+                "Q": 1,
+                "V": 1,
+            },
+            **sections,
+        }
+    )
+
+
+def test_get_filtered_db(tmp_path):
+    db = build_db(
+        [1.1, 2.2, 3.3, 4.4],
+        {
+            "chamber": ("uint8", [1, 1, 2, 2]),
+            "N2O": ("float64", [0.3, 0.4, 0.5, 0.6]),
+            "ALARM_STATUS": ("int8", [0, 1, 0, 0]),
+            "unused": ("float64", [1.0, 2.0, 3.0, 4.0]),
+        },
+    )
+    opentoolflux.database.save_db(db, tmp_path / opentoolflux.cli._DB_FILENAME)
+    conf = _build_config(tmp_path, filters={"ALARM_STATUS": {"allow_only": [0]}})
+    ctx = click.Context(opentoolflux.cli.main, obj={"config": conf})
+
+    filtered_db = opentoolflux.cli._get_filtered_db(ctx)
+
+    expected = db.iloc[[0, 2, 3]][["chamber", "ALARM_STATUS", "N2O"]]
+    pandas.testing.assert_frame_equal(filtered_db, expected, check_freq=False)
+    assert opentoolflux.cli._get_filtered_db(ctx) is filtered_db
+
+
+def test_get_filtered_db_requires_measurements(tmp_path):
+    conf = Config.parse_obj({"general": {"outdir": tmp_path}})
+    ctx = click.Context(opentoolflux.cli.main, obj={"config": conf})
+    with pytest.raises(click.ClickException):
+        opentoolflux.cli._get_filtered_db(ctx)
+
+
+def test_fluxes_keeps_previous_file_on_error(tmp_path):
+    db = build_db(
+        [1.0, 2.0, 3.0, 101.0, 102.0, 103.0],
+        {
+            "chamber": ("uint8", [1, 1, 1, 6, 6, 6]),
+            "N2O": ("float64", [0.3, 0.4, 0.5, 0.3, 0.4, 0.5]),
+        },
+    )
+    opentoolflux.database.save_db(db, tmp_path / opentoolflux.cli._DB_FILENAME)
+    fluxes_path = tmp_path / opentoolflux.cli._FLUXES_FILENAME
+    fluxes_path.write_text("previous estimates\n")
+    # No label for chamber 6, so the second measurement fails
+    conf = _build_config(tmp_path, chamber_labels={"1": "a"})
+    ctx = click.Context(opentoolflux.cli.main, obj={"config": conf})
+
+    with ctx, pytest.raises(click.UsageError):
+        ctx.invoke(opentoolflux.cli.fluxes, singlecore=True)
+
+    assert fluxes_path.read_text() == "previous estimates\n"
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        [opentoolflux.cli._DB_FILENAME, opentoolflux.cli._FLUXES_FILENAME]
+    )
+
+    conf = _build_config(tmp_path, chamber_labels={"1": "a", "6": "b"})
+    ctx = click.Context(opentoolflux.cli.main, obj={"config": conf})
+    with ctx:
+        ctx.invoke(opentoolflux.cli.fluxes, singlecore=True)
+    fluxes = pd.read_csv(fluxes_path)
+    assert list(fluxes["chamber_label"]) == ["a", "b"]
+
+
+def test_unused_src_cache_dirs_are_removed(tmp_path):
+    _write_src_file(tmp_path / "a" / "1.dat", [1.0, 2.0])
+    import_ = _import_config(str(tmp_path / "a" / "*.dat"))
+    cache_dir = opentoolflux.cli._get_src_cache_dir(tmp_path / "out", import_)
+    # Cache directories of other configs, e.g., from before editing the config
+    other_dirs = [cache_dir.parent / f"other-{i}" for i in range(5)]
+    for i, path in enumerate(other_dirs):
+        path.mkdir(parents=True)
+        (path / "data").write_text("cached data")
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+
+    opentoolflux.cli._read_src_files(
+        import_.src,
+        import_.columns,
+        import_.timestamp_col,
+        import_.sep,
+        cache_dir=cache_dir,
+        singlecore=True,
+    )
+
+    n_other_kept = opentoolflux.cli._SRC_CACHE_MAX_DIRS - 1
+    assert sorted(cache_dir.parent.iterdir()) == sorted(
+        [cache_dir, *other_dirs[-n_other_kept:]]
+    )
+    assert len(list(cache_dir.iterdir())) == 1
@@ -1,4 +1,5 @@
 import io
+import math
 import os
 from dataclasses import dataclass
 from pathlib import Path
@@ -151,6 +152,28 @@ source_parse_cases = [
             },
         ),
     ),
+    SourceParseCase(  # rows with null values are NOT dropped (comma separator)
+        "\n".join(
+            [
+                "A,B",
+                "1.1,1.2",
+                "2.1",
+                "3.1,3.2",
+            ]
+        ),
+        {
+            "A": "float64",
+            "B": "float32",
+        },
+        "A",
+        build_db(
+            [1.1, 2.1, 3.1],
+            {
+                "B": ("float32", [1.2, float("nan"), 3.2]),
+            },
+        ),
+        sep=",",
+    ),
     SourceParseCase(  # can ignore column(s) in the source
         "\n".join(
             [
@@ -271,6 +294,122 @@ source_parse_cases = [
         ),
         sep=",",
     ),
+    SourceParseCase(  # missing bool values are not allowed, also with one-char sep
+        "\n".join(
+            [
+                "t,B",
+                "1.1,True",
+                "2.1,",
+            ]
+        ),
+        {
+            "t": "float64",
+            "B": "bool",
+        },
+        "t",
+        ValueError,
+        sep=",",
+    ),
+    SourceParseCase(  # columns are returned in file order, also with one-char sep
+        "\n".join(
+            [
+                "C,t,B",
+                "1,1.1,2",
+            ]
+        ),
+        {
+            "t": "float64",
+            "B": "uint8",
+            "C": "uint8",
+        },
+        "t",
+        build_db(
+            [1.1],
+            {
+                "C": ("uint8", [1]),
+                "B": ("uint8", [2]),
+            },
+        ),
+        sep=",",
+    ),
+    SourceParseCase(  # missing columns are not allowed, also with one-char sep
+        "\n".join(
+            [
+                "t,B",
+                "1.1,2",
+            ]
+        ),
+        {
+            "t": "float64",
+            "B": "uint8",
+            "C": "uint8",
+        },
+        "t",
+        ValueError,
+        sep=",",
+    ),
+    SourceParseCase(  # missing values as in pandas, also with one-char sep
+        "\n".join(
+            [
+                "t,S,F",
+                "1.1,a,1.0",
+                "2.1,,NA",
+                "3.1,None,null",
+            ]
+        ),
+        {
+            "t": "float64",
+            "S": "str",
+            "F": "float32",
+        },
+        "t",
+        build_db(
+            [1.1, 2.1, 3.1],
+            {
+                "S": ("str", ["a", float("nan"), float("nan")]),
+                "F": ("float32", [1.0, float("nan"), float("nan")]),
+            },
+        ),
+        sep=",",
+    ),
+    SourceParseCase(  # only missing strings, also with one-char sep
+        "\n".join(
+            [
+                "t,S",
+                "1.1,",
+                "2.1,None",
+            ]
+        ),
+        {
+            "t": "float64",
+            "S": "str",
+        },
+        "t",
+        build_db(
+            [1.1, 2.1],
+            {
+                "S": ("str", [float("nan"), float("nan")]),
+            },
+        ),
+        sep=",",
+    ),
+    SourceParseCase(  # several missing timestamps are duplicates
+        "\n".join(
+            [
+                "t,A",
+                "1,1",
+                ",2",
+                ",3",
+            ]
+        ),
+        {
+            "t": "float64",
+            "A": "uint8",
+        },
+        "t",
+        ValueError,
+        sep=",",
+    ),
     SourceParseCase(  # float timestamps must be float64
         "\n".join(
             [
@@ -297,8 +436,9 @@ def test_source_file_parsing(case: SourceParseCase):
         result = opentoolflux.database.read_src_file(
             buffer, case.dtypes, case.timestamp_col, case.sep
         )
-        print(result)
-        pandas.testing.assert_frame_equal(result, case.expected_result)
+        pandas.testing.assert_frame_equal(
+            result, case.expected_result, check_exact=True
+        )
     else:
         with pytest.raises(case.expected_result):
             opentoolflux.database.read_src_file(
@@ -306,6 +446,18 @@ def test_source_file_parsing(case: SourceParseCase):
             )
 
 
+def test_missing_strings_are_nan():
+    # assert_frame_equal does not tell None from NaN, so check this separately
+    src_text = "t,S\n1.1,a\n2.1,\n"
+    dtypes = {"t": "float64", "S": "str"}
+    result = opentoolflux.database.read_src_file(
+        io.StringIO(src_text), dtypes, "t", ","
+    )
+    values = list(result["S"])
+    assert values[0] == "a"
+    assert isinstance(values[1], float) and math.isnan(values[1])
+
+
 @pytest.mark.parametrize("case", source_parse_cases)
 def test_db_save_and_load(case: SourceParseCase, tmp_path: Path):
     if not isinstance(case.expected_result, pd.DataFrame):
@@ -314,7 +466,11 @@ def test_db_save_and_load(case: SourceParseCase, tmp_path: Path):
     db = case.expected_result
     opentoolflux.database.save_db(db, db_path)
     db_roundtripped = opentoolflux.database.read_db(db_path)
-    pandas.testing.assert_frame_equal(db, db_roundtripped)
+    pandas.testing.assert_frame_equal(db, db_roundtripped, check_exact=True)
+
+    columns = list(db.columns[-1:])
+    db_subset = opentoolflux.database.read_db(db_path, columns)
+    pandas.testing.assert_frame_equal(db[columns], db_subset, check_exact=True)
 
 
 def test_update_db():
@@ -322,7 +478,22 @@ def test_update_db():
     db_2 = build_db([2.2, 3.3], {"B": ("uint8", [5, 3])})
     expected_result = build_db([1.1, 2.2, 3.3, 4.4], {"B": ("uint8", [1, 5, 3, 4])})
     result = opentoolflux.database.update(db_1, db_2)
-    pandas.testing.assert_frame_equal(result, expected_result)
+    pandas.testing.assert_frame_equal(result, expected_result, check_exact=True)
+
+    # Later databases take precedence also when many timestamps overlap
+    times = [float(i) for i in range(1000)]
+    db_old = build_db(times, {"B": ("uint8", [1] * len(times))})
+    db_new = build_db(times[::2], {"B": ("uint8", [2] * len(times[::2]))})
+    result = opentoolflux.database.update(db_old, db_new)
+    assert list(result["B"]) == [2, 1] * (len(times) // 2)
+
+    # A missing timestamp (NaT) is overridden like any other, so importing the same
+    # data again does not add rows
+    db_with_nat = build_db([1.1, float("nan")], {"B": ("uint8", [1, 2])})
+    result = db_with_nat
+    for _ in range(3):
+        result = opentoolflux.database.update(result, db_with_nat)
+    pandas.testing.assert_frame_equal(result, db_with_nat, check_exact=True)
 
     with pytest.raises(ValueError):
         db_2_other_dtype = build_db([2.2, 3.3], {"B": ("uint16", [5, 3])})
@@ -344,3 +515,32 @@ def test_create_empty_db():
     result = opentoolflux.database.create_empty_db({"t": "float64", **dtypes}, "t")
     assert len(result) == 0
     assert result.dtypes.to_dict() == dtypes
+
+
+def test_read_src_file_cached(tmp_path: Path):
+    src_path = tmp_path / "data.csv"
+    cache_dir = tmp_path / "cache"
+    dtypes = {"t": "float64", "A": "uint8"}
+
+    def read():
+        return opentoolflux.database.read_src_file_cached(
+            src_path, dtypes, "t", ",", cache_dir
+        )
+
+    src_path.write_text("t,A\n2.2,2\n1.1,1\n")
+    expected_result = build_db([1.1, 2.2], {"A": ("uint8", [1, 2])})
+    pandas.testing.assert_frame_equal(read(), expected_result, check_exact=True)
+    (cache_file,) = cache_dir.iterdir()
+
+    # The cached data is used as long as the file is unchanged
+    pandas.testing.assert_frame_equal(read(), expected_result, check_exact=True)
+    assert list(cache_dir.iterdir()) == [cache_file]
+
+    # A changed file is parsed again, and the outdated cache file can be pruned
+    src_path.write_text("t,A\n2.2,2\n1.1,1\n3.3,3\n")
+    expected_result = build_db([1.1, 2.2, 3.3], {"A": ("uint8", [1, 2, 3])})
+    pandas.testing.assert_frame_equal(read(), expected_result, check_exact=True)
+    assert len(list(cache_dir.iterdir())) == 2
+    opentoolflux.database.prune_src_file_cache(cache_dir, [src_path], dtypes, "t", ",")
+    assert len(list(cache_dir.iterdir())) == 1
+    assert cache_file not in cache_dir.iterdir()
@@ -3,6 +3,7 @@ import datetime
 import numpy as np
 import opentoolflux.fluxes
 import pandas as pd
+import pytest
 
 
 def test_recover_flux():
@@ -16,9 +17,11 @@ def test_recover_flux():
     num_samples = 1000
     times_s = np.linspace(0, measurement_duration, num_samples)
     elapsed_s = times_s - t0_delay
-    is_before_t0 = elapsed_s < 0
-    concentrations = c0 + F * tau_s / h * (1 - np.exp(-elapsed_s / tau_s))
-    concentrations[is_before_t0] = c0 * 1000  # what happens before t0 is irrelevant
+    concentrations = np.where(
+        elapsed_s < 0,
+        c0 * 1000,  # what happens before t0 is irrelevant
+        c0 - F * tau_s / h * np.expm1(-elapsed_s / tau_s),
+    )
     measurement = pd.Series(
         data=concentrations,
         index=(times_s * 1e3).astype("datetime64[ms]"),  # type: ignore
@@ -32,7 +35,6 @@ def test_recover_flux():
         tau_s=tau_s,
         h=h,
     )
-    print(result)
     assert _rel_error(result["c0"], c0) < 1e-3
     assert _rel_error(result["vol_flux"], F) < 1e-3
 
@@ -59,5 +61,112 @@ def test_recover_flux():
     assert _rel_error(result["vol_flux"], F) > 0.5
 
 
+def test_estimate_vol_fluxes_matches_lstsq():
+    times_s = np.linspace(0, 1200.0, 500)
+    rng = np.random.default_rng(0)
+    measurement = pd.DataFrame(
+        {
+            "a": 0.3 + 1e-5 * times_s + 1e-4 * rng.standard_normal(len(times_s)),
+            "b": 400 - 1e-2 * times_s + np.sin(times_s),
+        },
+        index=(times_s * 1e3).astype("datetime64[ms]"),  # type: ignore
+    )
+    t0_delay_s = 300
+    t0_margin_s = 100
+    tau_s = 10000.0
+    h = 0.2
+
+    results = opentoolflux.fluxes.estimate_vol_fluxes(
+        measurement,
+        ["a", "b"],
+        t0_delay=datetime.timedelta(seconds=t0_delay_s),
+        t0_margin=datetime.timedelta(seconds=t0_margin_s),
+        tau_s=tau_s,
+        h=h,
+    )
+
+    assert list(results) == ["a", "b"]
+    # The index has millisecond resolution, so use it rather than times_s
+    index_s = (measurement.index - measurement.index[0]).total_seconds().to_numpy()
+    is_analyzed = index_s >= t0_delay_s + t0_margin_s
+    elapsed_s = index_s[is_analyzed] - t0_delay_s
+    for gas, result in results.items():
+        expected_c0, expected_vol_flux = _lstsq_fit(
+            elapsed_s, measurement[gas].to_numpy()[is_analyzed], tau_s, h
+        )
+        np.testing.assert_allclose(result["c0"], expected_c0, rtol=1e-9)
+        np.testing.assert_allclose(result["vol_flux"], expected_vol_flux, rtol=1e-9)
+        assert result["fit_start"] == measurement.index[is_analyzed][0]
+        assert result["fit_end"] == measurement.index[-1]
+
+
+def test_closed_form_fit_matches_lstsq():
+    rng = np.random.default_rng(1)
+    tau_s = 500.0
+    h = 0.3
+    elapsed_s = np.sort(rng.uniform(0, 1000, 200))
+    concentrations = [
+        2.0 + 1e-3 * elapsed_s + rng.standard_normal(len(elapsed_s)),
+        np.full(len(elapsed_s), 5.0) + 1e-6 * rng.standard_normal(len(elapsed_s)),
+    ]
+    # Repeated sampling times are fine as long as not all of them are equal
+    duplicated_elapsed_s = np.repeat(elapsed_s[::2], 2)
+
+    for elapsed in (elapsed_s, duplicated_elapsed_s):
+        solutions = opentoolflux.fluxes._calculate_vol_fluxes_from_cleaned_data(
+            elapsed, concentrations, tau_s, h
+        )
+        for (c0, vol_flux), b in zip(solutions, concentrations):
+            expected_c0, expected_vol_flux = _lstsq_fit(elapsed, b, tau_s, h)
+            np.testing.assert_allclose(c0, expected_c0, rtol=1e-9)
+            np.testing.assert_allclose(
+                vol_flux, expected_vol_flux, rtol=1e-9, atol=1e-15
+            )
+
+
+@pytest.mark.parametrize(
+    "elapsed_s, concentrations",
+    [
+        ([30.0], [1.5]),  # one sample
+        ([30.0, 30.0, 30.0], [1.0, 2.0, 4.0]),  # constant sampling time
+        ([0.0, 0.0], [1.0, 3.0]),  # constant sampling time at t0 (z == 0)
+    ],
+)
+def test_fit_degenerate_data(elapsed_s, concentrations):
+    # With less than two distinct sampling times the fit is underdetermined; the
+    # fallback on lstsq gives the (minimum-norm) solution through the mean value.
+    tau_s = 500.0
+    h = 0.3
+    elapsed = np.array(elapsed_s)
+    b = np.array(concentrations)
+    ((c0, vol_flux),) = opentoolflux.fluxes._calculate_vol_fluxes_from_cleaned_data(
+        elapsed, [b], tau_s, h
+    )
+    z = -tau_s / h * np.expm1(-elapsed / tau_s)
+    assert np.isfinite(c0) and np.isfinite(vol_flux)
+    np.testing.assert_allclose(c0 + vol_flux * z, b.mean(), rtol=1e-12)
+
+
+def test_fit_two_samples():
+    # Two samples with distinct times are fitted exactly
+    tau_s = 500.0
+    h = 0.3
+    elapsed = np.array([10.0, 250.0])
+    b = np.array([1.0, 1.2])
+    ((c0, vol_flux),) = opentoolflux.fluxes._calculate_vol_fluxes_from_cleaned_data(
+        elapsed, [b], tau_s, h
+    )
+    z = -tau_s / h * np.expm1(-elapsed / tau_s)
+    np.testing.assert_allclose(c0 + vol_flux * z, b, rtol=1e-12)
+
+
 def _rel_error(estimate, true_value):
     return abs(estimate / true_value - 1)
+
+
+def _lstsq_fit(elapsed_s, concentrations, tau_s, h):
+    # Straightforward fit of the model, as a reference for the estimates
+    z = tau_s / h * (1 - np.exp(-elapsed_s / tau_s))
+    a = np.column_stack([np.ones_like(z), z])
+    (c0, vol_flux), _, _, _ = np.linalg.lstsq(a, concentrations, rcond=None)
+    return c0, vol_flux
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
 import datetime
-import itertools
 from dataclasses import dataclass
 
 import numpy as np
 import opentoolflux.database
 import pandas.testing
-from opentoolflux.measurements import Filter, filter_db, iter_measurements
+import pytest
+from opentoolflux.measurements import (
+    Filter,
+    count_measurements,
+    filter_db,
+    iter_measurement_arrays,
+    iter_measurements,
+)
 
 from tests.util import build_db
 
@@ -35,7 +41,50 @@ def test_filter():
 
     expected_result = db_before.iloc[[2, 3]]
 
-    pandas.testing.assert_frame_equal(filter_db(db_before, filters), expected_result)
+    pandas.testing.assert_frame_equal(
+        filter_db(db_before, filters), expected_result, check_exact=True
+    )
+
+
+@pytest.mark.parametrize(
+    "filter_",
+    [
+        Filter(min_value="1970-01-01 00:00:02", max_value="1970-01-01 00:00:04"),
+        Filter(
+            min_value=datetime.datetime(1970, 1, 1, 0, 0, 2),
+            max_value=datetime.datetime(1970, 1, 1, 0, 0, 4),
+        ),
+    ],
+)
+def test_filter_timestamps(filter_: Filter):
+    # As documented in the README, the timestamp bounds can be given as strings,
+    # and TOML datetimes are parsed into datetime objects.
+    db_before = build_db([1.1, 2.2, 3.3, 4.4], {"B": ("uint8", [1, 2, 3, 4])})
+    filters = {opentoolflux.database.TIMESTAMP_COLUMN: filter_}
+    expected_result = db_before.iloc[[1, 2]]
+    pandas.testing.assert_frame_equal(
+        filter_db(db_before, filters), expected_result, check_exact=True
+    )
+
+
+def test_filter_values_are_not_cast_to_column_dtype():
+    db_before = build_db(
+        [1.1, 2.2, 3.3, 4.4],
+        {
+            "F": ("float16", [0.1, 0.2, 0.5, 1.0]),
+            "U": ("uint8", [1, 2, 3, 4]),
+        },
+    )
+
+    # 0.1 and 0.2 are not exactly representable as float16, so nothing matches
+    result = filter_db(db_before, {"F": Filter(disallow=[0.1, 0.2])})
+    pandas.testing.assert_frame_equal(result, db_before, check_exact=True)
+
+    # The string "1" does not match the integer 1
+    result = filter_db(db_before, {"U": Filter(disallow=["1", 2])})
+    pandas.testing.assert_frame_equal(
+        result, db_before.iloc[[0, 2, 3]], check_exact=True
+    )
 
 
 def test_split():
@@ -61,39 +110,45 @@ def test_split():
         Part(True, "G1", "G", [0.1, 1.0, 1.0, 1.0, 1.0]),  # OK duration (4.0), OK gaps
     )
 
-    times = np.cumsum(list(itertools.chain(*(part.time_increments for part in parts))))
-    identifiers = list(
-        itertools.chain(
-            *([part.identifier] * len(part.time_increments) for part in parts)
-        )
-    )
-    labels = list(
-        itertools.chain(*([part.label] * len(part.time_increments) for part in parts))
-    )
+    lengths = [len(part.time_increments) for part in parts]
+    times = np.cumsum(np.concatenate([part.time_increments for part in parts]))
+    identifiers = np.repeat([part.identifier for part in parts], lengths)
+    labels = np.repeat([part.label for part in parts], lengths)
 
     db = build_db(
-        list(times),
+        times,
         {
             "A": ("str", labels),
             "I": ("str", identifiers),
         },
     )
 
-    measurements = list(
-        iter_measurements(
-            db,
-            "A",
-            max_gap=datetime.timedelta(seconds=max_gap),
-            min_duration=datetime.timedelta(seconds=min_duration),
-            max_duration=datetime.timedelta(seconds=max_duration),
-        )
+    split_kwargs = dict(
+        max_gap=datetime.timedelta(seconds=max_gap),
+        min_duration=datetime.timedelta(seconds=min_duration),
+        max_duration=datetime.timedelta(seconds=max_duration),
     )
 
+    measurements = list(iter_measurements(db, "A", **split_kwargs))
+
     expected_measurements = [
         db.loc[db["I"] == part.identifier] for part in parts if part.included
     ]
 
+    assert count_measurements(db, "A", **split_kwargs) == len(expected_measurements)
+
     for measeurement, expected_measurement in zip(measurements, expected_measurements):
-        print(measeurement)
-        print(expected_measurement)
-        pandas.testing.assert_frame_equal(measeurement, expected_measurement)
+        pandas.testing.assert_frame_equal(
+            measeurement, expected_measurement, check_exact=True
+        )
+
+    measurement_arrays = list(iter_measurement_arrays(db, "A", ["I"], **split_kwargs))
+    assert len(measurement_arrays) == len(expected_measurements)
+    for arrays, expected_measurement in zip(measurement_arrays, expected_measurements):
+        assert arrays.chamber_value == expected_measurement["A"].iloc[0]
+        np.testing.assert_array_equal(
+            arrays.timestamps, expected_measurement.index.to_numpy()
+        )
+        np.testing.assert_array_equal(
+            arrays.columns["I"], expected_measurement["I"].to_numpy()
+        )
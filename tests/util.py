@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from typing import Mapping, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
 
 import opentoolflux.database
@@ -10,19 +11,15 @@ import opentoolflux.database
 def build_db(
     timestamps: Sequence[float], cols: Mapping[str, Tuple[str, Sequence]]
 ) -> pd.DataFrame:
-    return (
-        pd.DataFrame(
-            {
-                col: pd.Series(dtype=dtype, data=values)
-                for col, (dtype, values) in cols.items()
-            }
-        )
-        .assign(
-            **{
-                opentoolflux.database.TIMESTAMP_COLUMN: opentoolflux.database.convert_datetime(
-                    pd.Series(timestamps)
-                ),
-            }
-        )
-        .set_index(opentoolflux.database.TIMESTAMP_COLUMN)
+    index = pd.DatetimeIndex(
+        opentoolflux.database.convert_datetime(pd.Series(timestamps)),
+        name=opentoolflux.database.TIMESTAMP_COLUMN,
+    )
+    return pd.DataFrame(
+        {
+            col: np.asarray(values, dtype=object if dtype == "str" else dtype)
+            for col, (dtype, values) in cols.items()
+        },
+        index=index,
+        copy=False,
     )